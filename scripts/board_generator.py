@@ -3,8 +3,21 @@
 Generate SVG chess board visualization
 """
 
+import io
 import chess
+import chess.polyglot
 import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from utils import file_has_content, remember_file_content
+
+# Maximum number of rendered positions kept per generator
+SVG_CACHE_SIZE = 1024
+
+# Shared generator instance, see get_default_generator()
+_default_generator = None
 
 class BoardGenerator:
     def __init__(self):
@@ -15,11 +28,50 @@ class BoardGenerator:
             'p': '♙', 'r': '♖', 'n': '♘', 'b': '♗', 'q': '♕', 'k': '♔'   # White pieces
         }
         
-        # Colors
-        self.light_square = '#F0D9B5'
-        self.dark_square = '#B58863'
-        self.text_color = '#333333'
+        # Colors (interned so the color table shares two string objects)
+        self.light_square = sys.intern('#F0D9B5')
+        self.dark_square = sys.intern('#B58863')
+        self.text_color = sys.intern('#333333')
+        
+        # Square color indexed by square number (rank * 8 + file)
+        self._colors = tuple(
+            self.light_square if (r + f) % 2 == 0 else self.dark_square
+            for r in range(8) for f in range(8)
+        )
+        
+        # Each piece glyph is defined once per SVG and placed with <use>
+        self._glyph_def_tmpl = (
+            '<text id="p_%s" text-anchor="middle" '
+            f'font-family="serif" font-size="%d" fill="{self.text_color}">%s</text>\n'
+        )
+        self._use_tmpl = '<use href="#p_%s" x="%d" y="%d"/>\n'
+        
+        # Board geometry never changes, so render the squares and labels once
+        self._bg_full = self._build_static_bg(60, 30, 50)
+        self._bg_min = self._build_static_bg(40, 0, 32)
+        
+        # Piece text anchors per file/rank, so renders only index tables
+        self._tx_full = tuple(30 + f * 60 + 60 // 2 for f in range(8))
+        self._ty_full = tuple(30 + (7 - r) * 60 + 60 // 2 + 8 for r in range(8))
+        self._tx_min = tuple(f * 40 + 40 // 2 for f in range(8))
+        self._ty_min = tuple((7 - r) * 40 + 40 // 2 + 6 for r in range(8))
+        
+        # Square rects of the full-size board, used to patch single squares
+        self._rects_full = self._build_rect_table(60, 30)
         
+        # Pre-rendered glyph reference for every piece on every square
+        self._glyphs_full = self._build_glyph_table(self._tx_full, self._ty_full)
+        self._glyphs_min = self._build_glyph_table(self._tx_min, self._ty_min)
+        
+        # LRU cache of rendered SVGs keyed by (variant, Zobrist hash),
+        # shared between threads and guarded by its lock
+        self._svg_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._last_written = None
+        
+        # Per-thread output buffer reused across renders
+        self._local = threading.local()
+    
     def get_piece_symbol(self, piece):
         """Get Unicode symbol for chess piece"""
         if piece is None:
@@ -29,129 +81,235 @@ class BoardGenerator:
         symbol = piece.symbol()
         return self.piece_symbols.get(symbol, '')
     
-    def generate_board_svg(self, board):
-        """Generate SVG representation of chess board"""
-        square_size = 60
+    def _build_glyph_table(self, tx, ty):
+        """Map (piece_type, color) to a 64-tuple of encoded glyph references"""
+        table = {}
+        for color in chess.COLORS:
+            for piece_type in chess.PIECE_TYPES:
+                symbol = chess.Piece(piece_type, color).symbol()
+                table[piece_type, color] = tuple(
+                    (self._use_tmpl % (symbol, tx[square & 7], ty[square >> 3])).encode('utf-8')
+                    for square in range(64)
+                )
+        return table
+    
+    def _get_buffer(self):
+        """Get this thread's reusable output buffer, emptied"""
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = io.BytesIO()
+        else:
+            buf.seek(0)
+            buf.truncate()
+        return buf
+    
+    def _write_pieces(self, board, glyphs, w):
+        """Write glyphs for occupied squares, walking one bitboard per piece kind"""
+        pieces_mask = board.pieces_mask
+        for (piece_type, color), row in glyphs.items():
+            for square in chess.scan_forward(pieces_mask(piece_type, color)):
+                w(row[square])
+    
+    def _build_rect_table(self, square_size, margin):
+        """Render the background rect of every square, indexed by square"""
+        rects = []
+        for square in range(64):
+            rank = square >> 3
+            file = square & 7
+            x = margin + file * square_size
+            y = margin + (7 - rank) * square_size  # Flip vertically for proper orientation
+            rects.append(
+                f'<rect x="{x}" y="{y}" width="{square_size}" height="{square_size}" fill="{self._colors[square]}"/>\n'
+            )
+        return tuple(rects)
+    
+    def _build_static_bg(self, square_size, margin, font_size):
+        """Pre-render and encode everything except the pieces and closing tag"""
         board_size = square_size * 8
-        margin = 30
-        total_size = board_size + 2 * margin
+        
+        buf = io.StringIO()
+        w = buf.write
         
         # Start SVG
-        svg_lines = [
-            f'<svg width="{total_size}" height="{total_size}" xmlns="http://www.w3.org/2000/svg">',
-            f'<rect width="{total_size}" height="{total_size}" fill="#FFFFFF"/>',
-            f'<!-- Chess Board -->',
-        ]
-        
-        # Draw squares and pieces
-        for rank in range(8):
+        if margin:
+            total_size = board_size + 2 * margin
+            w(f'<svg width="{total_size}" height="{total_size}" xmlns="http://www.w3.org/2000/svg">\n')
+            w(f'<rect width="{total_size}" height="{total_size}" fill="#FFFFFF"/>\n')
+            w('<!-- Chess Board -->\n')
+        else:
+            w(f'<svg width="{board_size}" height="{board_size}" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {board_size} {board_size}">\n')
+        
+        # Piece glyph definitions
+        w('<defs>\n')
+        for symbol, piece_symbol in self.piece_symbols.items():
+            w(self._glyph_def_tmpl % (symbol, font_size, piece_symbol))
+        w('</defs>\n')
+        
+        # Draw squares
+        for rect in self._build_rect_table(square_size, margin):
+            w(rect)
+        
+        if margin:
+            # Add coordinate labels
+            # Files (a-h) at bottom
             for file in range(8):
-                x = margin + file * square_size
-                y = margin + (7 - rank) * square_size  # Flip vertically for proper orientation
-                
-                # Square color
-                is_light = (rank + file) % 2 == 0
-                square_color = self.light_square if is_light else self.dark_square
-                
-                # Draw square
-                svg_lines.append(
-                    f'<rect x="{x}" y="{y}" width="{square_size}" height="{square_size}" fill="{square_color}"/>'
+                x = margin + file * square_size + square_size // 2
+                y = total_size - 10
+                file_label = chr(ord('a') + file)
+                w(
+                    f'<text x="{x}" y="{y}" text-anchor="middle" '
+                    f'font-family="monospace" font-size="14" fill="{self.text_color}">'
+                    f'{file_label}</text>\n'
+                )
+            
+            # Ranks (1-8) at left
+            for rank in range(8):
+                x = 15
+                y = margin + (7 - rank) * square_size + square_size // 2 + 5
+                rank_label = str(rank + 1)
+                w(
+                    f'<text x="{x}" y="{y}" text-anchor="middle" '
+                    f'font-family="monospace" font-size="14" fill="{self.text_color}">'
+                    f'{rank_label}</text>\n'
                 )
-                
-                # Get piece at this square
-                square = chess.square(file, rank)
-                piece = board.piece_at(square)
-                
-                if piece:
-                    piece_symbol = self.get_piece_symbol(piece)
-                    if piece_symbol:
-                        # Center piece in square
-                        text_x = x + square_size // 2
-                        text_y = y + square_size // 2 + 8  # Offset for text centering
-                        
-                        svg_lines.append(
-                            f'<text x="{text_x}" y="{text_y}" text-anchor="middle" '
-                            f'font-family="serif" font-size="{square_size-10}" fill="{self.text_color}">'
-                            f'{piece_symbol}</text>'
-                        )
-        
-        # Add coordinate labels
-        # Files (a-h) at bottom
-        for file in range(8):
-            x = margin + file * square_size + square_size // 2
-            y = total_size - 10
-            file_label = chr(ord('a') + file)
-            svg_lines.append(
-                f'<text x="{x}" y="{y}" text-anchor="middle" '
-                f'font-family="monospace" font-size="14" fill="{self.text_color}">'
-                f'{file_label}</text>'
-            )
         
-        # Ranks (1-8) at left
-        for rank in range(8):
-            x = 15
-            y = margin + (7 - rank) * square_size + square_size // 2 + 5
-            rank_label = str(rank + 1)
-            svg_lines.append(
-                f'<text x="{x}" y="{y}" text-anchor="middle" '
-                f'font-family="monospace" font-size="14" fill="{self.text_color}">'
-                f'{rank_label}</text>'
-            )
+        return buf.getvalue().encode('utf-8')
+    
+    def _cache_get(self, key):
+        """Return a cached SVG and mark it most recently used"""
+        with self._cache_lock:
+            svg_content = self._svg_cache.get(key)
+            if svg_content is not None:
+                self._svg_cache.move_to_end(key)
+        return svg_content
+    
+    def _cache_put(self, key, svg_content):
+        """Store a rendered SVG, evicting the least recently used entry"""
+        with self._cache_lock:
+            self._svg_cache[key] = svg_content
+            if len(self._svg_cache) > SVG_CACHE_SIZE:
+                self._svg_cache.popitem(last=False)
+    
+    def generate_board_svg(self, board):
+        """Generate SVG representation of chess board"""
+        return self.generate_board_svg_bytes(board).decode('utf-8')
+    
+    def generate_board_svg_bytes(self, board):
+        """Generate the board SVG as UTF-8 encoded bytes"""
+        key = ('full', chess.polyglot.zobrist_hash(board))
+        svg_content = self._cache_get(key)
+        if svg_content is None:
+            svg_content = self._render_board_svg(board)
+            self._cache_put(key, svg_content)
+        return svg_content
+    
+    def write_svg(self, board, path='board.svg'):
+        """Render the board and write it to disk atomically"""
+        svg_content = self.generate_board_svg_bytes(board)
         
-        # Close SVG
-        svg_lines.append('</svg>')
+        # Skip the disk write if this exact content is already there
+        key = (path, chess.polyglot.zobrist_hash(board))
+        if key == self._last_written:
+            return svg_content
         
-        # Write to file
-        svg_content = '\n'.join(svg_lines)
+        # Likewise if an earlier run already wrote it
+        if file_has_content(path, svg_content):
+            self._last_written = key
+            return svg_content
+        
+        tmp_path = f"{path}.tmp"
         try:
-            with open('board.svg', 'w') as f:
+            with open(tmp_path, 'wb') as f:
                 f.write(svg_content)
+            os.replace(tmp_path, path)
+            remember_file_content(path, svg_content)
+            self._last_written = key
             print("Board SVG generated successfully")
         except Exception as e:
             print(f"Error writing SVG file: {e}")
         
         return svg_content
     
+    def _render_board_svg(self, board):
+        """Render the full-size board SVG"""
+        buf = self._get_buffer()
+        w = buf.write
+        w(self._bg_full)
+        
+        # Draw pieces on top of the pre-rendered board
+        self._write_pieces(board, self._glyphs_full, w)
+        
+        # Close SVG
+        w(b'</svg>')
+        return buf.getvalue()
+    
+    def generate_board_svg_delta(self, prev_board, new_board):
+        """
+        Generate full-size SVG fragments for squares that changed between positions
+        Returns a list of (square, svg_fragment) tuples; each fragment repaints
+        the square background and the piece now standing on it, if any, and
+        refers to the glyph <defs> of the full-size board SVG
+        """
+        prev_map = prev_board.piece_map()
+        new_map = new_board.piece_map()
+        
+        fragments = []
+        for square in sorted(prev_map.keys() | new_map.keys()):
+            piece = new_map.get(square)
+            if prev_map.get(square) == piece:
+                continue
+            
+            fragment = self._rects_full[square]
+            if piece:
+                fragment += self._glyphs_full[piece.piece_type, piece.color][square].decode('utf-8')
+            fragments.append((square, fragment))
+        
+        return fragments
+    
     def generate_minimal_board_svg(self, board):
         """Generate a minimal SVG board for embedding"""
-        square_size = 40
-        board_size = square_size * 8
+        return self.generate_minimal_board_svg_bytes(board).decode('utf-8')
+    
+    def generate_minimal_board_svg_bytes(self, board):
+        """Generate the minimal board SVG as UTF-8 encoded bytes"""
+        key = ('min', chess.polyglot.zobrist_hash(board))
+        svg_content = self._cache_get(key)
+        if svg_content is None:
+            svg_content = self._render_minimal_board_svg(board)
+            self._cache_put(key, svg_content)
+        return svg_content
+    
+    def generate_many(self, boards, workers=None):
+        """Generate minimal SVGs for many positions using a process pool"""
+        boards = list(boards)
+        if workers == 1 or len(boards) < 2:
+            return [self.generate_minimal_board_svg(board) for board in boards]
         
-        # Start SVG
-        svg_lines = [
-            f'<svg width="{board_size}" height="{board_size}" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {board_size} {board_size}">',
-        ]
+        # Workers render with their own shared generator, so self is never pickled
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(_generate_minimal_board_svg, boards, chunksize=32))
+    
+    def _render_minimal_board_svg(self, board):
+        """Render the minimal embeddable board SVG"""
+        buf = self._get_buffer()
+        w = buf.write
+        w(self._bg_min)
         
-        # Draw squares and pieces
-        for rank in range(8):
-            for file in range(8):
-                x = file * square_size
-                y = (7 - rank) * square_size  # Flip vertically
-                
-                # Square color
-                is_light = (rank + file) % 2 == 0
-                square_color = self.light_square if is_light else self.dark_square
-                
-                # Draw square
-                svg_lines.append(
-                    f'<rect x="{x}" y="{y}" width="{square_size}" height="{square_size}" fill="{square_color}"/>'
-                )
-                
-                # Get piece
-                square = chess.square(file, rank)
-                piece = board.piece_at(square)
-                
-                if piece:
-                    piece_symbol = self.get_piece_symbol(piece)
-                    if piece_symbol:
-                        text_x = x + square_size // 2
-                        text_y = y + square_size // 2 + 6
-                        
-                        svg_lines.append(
-                            f'<text x="{text_x}" y="{text_y}" text-anchor="middle" '
-                            f'font-family="serif" font-size="{square_size-8}" fill="{self.text_color}">'
-                            f'{piece_symbol}</text>'
-                        )
-        
-        svg_lines.append('</svg>')
-        return '\n'.join(svg_lines)
+        # Draw pieces on top of the pre-rendered board
+        self._write_pieces(board, self._glyphs_min, w)
+        
+        w(b'</svg>')
+        return buf.getvalue()
+
+
+def _generate_minimal_board_svg(board):
+    """Process pool entry point for BoardGenerator.generate_many"""
+    return get_default_generator().generate_minimal_board_svg(board)
+
+
+def get_default_generator():
+    """Get the shared BoardGenerator, creating it on first use"""
+    global _default_generator
+    if _default_generator is None:
+        _default_generator = BoardGenerator()
+    return _default_generator
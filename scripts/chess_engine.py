@@ -3,37 +3,206 @@
 Chess engine handling game logic, AI moves, and game state management
 """
 
+import atexit
 import chess
 import chess.engine
 import chess.pgn
+import chess.polyglot
 import os
+import shutil
+import time
 from datetime import datetime
+from operator import itemgetter
+from utils import discard_pgn
+
+def find_stockfish():
+    """Locate the Stockfish binary, or None if it is not installed"""
+    stockfish_path = '/usr/games/stockfish'  # Default Ubuntu path
+    if os.path.exists(stockfish_path):
+        return stockfish_path
+    return shutil.which('stockfish')  # Try system PATH
+
+# Resolved once at import so a missing engine costs no spawn attempt per move
+STOCKFISH_PATH = find_stockfish()
+
+def attacks_from(piece_type, color, square, occupied):
+    """Attack mask of a piece standing on square, given the board occupancy"""
+    if piece_type == chess.PAWN:
+        return chess.BB_PAWN_ATTACKS[color][square]
+    if piece_type == chess.KNIGHT:
+        return chess.BB_KNIGHT_ATTACKS[square]
+    if piece_type == chess.KING:
+        return chess.BB_KING_ATTACKS[square]
+    
+    attacks = 0
+    if piece_type in (chess.BISHOP, chess.QUEEN):
+        attacks |= chess.BB_DIAG_ATTACKS[square][chess.BB_DIAG_MASKS[square] & occupied]
+    if piece_type in (chess.ROOK, chess.QUEEN):
+        attacks |= (chess.BB_RANK_ATTACKS[square][chess.BB_RANK_MASKS[square] & occupied] |
+                    chess.BB_FILE_ATTACKS[square][chess.BB_FILE_MASKS[square] & occupied])
+    return attacks
+
+# Transposition table bound flags
+TT_EXACT = 0
+TT_LOWER = 1
+TT_UPPER = 2
+
+# Number of transposition table slots (must be a power of two)
+TT_SIZE = 1 << 20
+
+# Polyglot Zobrist keys; a piece's key is ZOBRIST[64 * piece_index + square]
+# with piece_index = (piece_type - 1) * 2 + color
+ZOBRIST = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_TURN = ZOBRIST[780]
+_zobrist_hasher = chess.polyglot.ZobristHasher(ZOBRIST)
+
+# Half-width of the aspiration window around the previous iteration's score
+ASPIRATION_WINDOW = 50
+
+# Most opponent replies to a checking move for which mate in 2 is searched
+MATE_IN_2_MAX_REPLIES = 6
+
+# Wall-clock budget in seconds for the fallback minimax search
+SEARCH_TIME_LIMIT = 5.0
+
+# Manhattan distance of each square from the board center (1 on the four
+# center squares up to 7 in the corners); the half-square offsets cancel,
+# so the table holds exact ints
+CENTER_DIST = tuple(
+    int(abs(chess.square_file(sq) - 3.5) + abs(chess.square_rank(sq) - 3.5))
+    for sq in chess.SQUARES
+)
+
+# Piece-square tables indexed [piece_type][square] from White's side of the
+# board (mirror the square for Black); pawns gain for advancing, minor pieces
+# for standing near the center
+PST_PAWN = tuple(chess.square_rank(sq) * 5 for sq in chess.SQUARES)
+PST_MINOR = tuple(10 - CENTER_DIST[sq] * 2 for sq in chess.SQUARES)
+PST_NONE = (0,) * 64
+PST = (None, PST_PAWN, PST_MINOR, PST_MINOR, PST_NONE, PST_NONE, PST_NONE)
+
+# Squares scored by the positional move heuristics
+BB_MINOR_HOME = chess.BB_B1 | chess.BB_G1 | chess.BB_C1 | chess.BB_F1
+BB_CASTLED_KING = chess.BB_G1 | chess.BB_C1
+BB_KNIGHT_DEVELOPED = chess.BB_F3 | chess.BB_C3 | chess.BB_F6 | chess.BB_C6
+BB_BISHOP_DEVELOPED = (chess.BB_C4 | chess.BB_F4 | chess.BB_E2 |
+                       chess.BB_C5 | chess.BB_F5 | chess.BB_E7)
+
+# Piece values in pawns for static exchange evaluation, indexed by piece type
+SEE_VALUES = (0, 1, 3, 3, 5, 9, 100)
+
+# Capture ordering scores indexed [victim_type][attacker_type]: most valuable
+# victim first, then least valuable attacker
+MVV_LVA = tuple(
+    tuple(100 * (10 * SEE_VALUES[victim] - SEE_VALUES[attacker]) for attacker in range(7))
+    for victim in range(7)
+)
+
+# Optional Polyglot opening book, consulted before the built-in responses
+OPENING_BOOK_PATH = 'book.bin'
+
+# Respond to common openings with best theoretical moves, keyed by board FEN
+OPENING_RESPONSES = {
+    # Respond to 1.e4
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR": ["c5", "e5", "c6"],
+    # Respond to 1.d4  
+    "rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR": ["Nf6", "d5", "f5"],
+    # Italian Game response
+    "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R": ["f5", "Be7", "Nf6"]
+}
+
+def compile_opening_book(responses):
+    """Parse SAN opening responses for Black into Move lists, keyed by board FEN"""
+    book = {}
+    for board_fen, responses_san in responses.items():
+        board = chess.Board()
+        board.set_board_fen(board_fen)
+        board.turn = chess.BLACK
+        moves = []
+        for response in responses_san:
+            try:
+                moves.append(board.parse_san(response))
+            except ValueError:
+                continue
+        book[board_fen] = moves
+    return book
+
+# OPENING_RESPONSES parsed once at import
+OPENING_BOOK = compile_opening_book(OPENING_RESPONSES)
+
+def material_balance(white, black, pawns, knights, bishops, rooks, queens):
+    """
+    Material score in centipawns (positive favors White) from raw bitboards
+    Takes plain ints only, so it stays free of chess.Board overhead
+    """
+    popcount = chess.popcount
+    return (
+        100 * (popcount(pawns & white) - popcount(pawns & black)) +
+        320 * (popcount(knights & white) - popcount(knights & black)) +
+        330 * (popcount(bishops & white) - popcount(bishops & black)) +
+        500 * (popcount(rooks & white) - popcount(rooks & black)) +
+        900 * (popcount(queens & white) - popcount(queens & black))
+    )
 
 class ChessEngine:
     def __init__(self):
         """Initialize chess engine with current game state"""
         self.board = chess.Board()
+        # Transposition table: slot -> (key, depth, value, flag, best_move),
+        # kept across searches so later moves reuse earlier work. Values and
+        # bounds are oriented by the side to move at the root, recorded here
+        self.tt = {}
+        self._tt_color = None
+        # (move number, white moved, SAN) of each move played in this session
+        self.san_history = []
+        # (SAN, Move) last returned by get_ai_move, so make_ai_move can skip
+        # parsing the SAN back
+        self._ai_move = None
+        # Stockfish process, started on first use and kept for later moves
+        self._engine = None
+        # Identifies the current game to Stockfish; it only receives
+        # ucinewgame (and clears its hash) when this changes
+        self._game = object()
+        self._book = self._open_book()
+        # Incrementally updated Zobrist hash of the board being searched,
+        # with the hashes of the positions above it on the search path
+        self._hash = 0
+        self._hash_stack = []
         self.load_game_state()
         
+    def _open_book(self):
+        """Open the Polyglot opening book, or return None if there is none"""
+        try:
+            return chess.polyglot.open_reader(OPENING_BOOK_PATH)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error opening book: {e}")
+            return None
+        
     def load_game_state(self):
         """Load game state from FEN file"""
         try:
-            if os.path.exists('game_state.fen'):
-                with open('game_state.fen', 'r') as f:
-                    fen = f.read().strip()
-                    if fen:
-                        self.board = chess.Board(fen)
-                        print(f"Loaded game state: {fen}")
+            with open('game_state.fen', 'r') as f:
+                fen = f.read().strip()
+                if fen:
+                    self.board = chess.Board(fen)
+                    self.san_history = []
+                    print(f"Loaded game state: {fen}")
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"Error loading game state: {e}")
             self.board = chess.Board()
+            self.san_history = []
             
     def save_game_state(self):
         """Save current game state to FEN file"""
+        fen = self.board.fen()
         try:
             with open('game_state.fen', 'w') as f:
-                f.write(self.board.fen())
-            print(f"Saved game state: {self.board.fen()}")
+                f.write(fen)
+            print(f"Saved game state: {fen}")
         except Exception as e:
             print(f"Error saving game state: {e}")
             
@@ -47,32 +216,37 @@ class ChessEngine:
         Returns (success: bool, message: str)
         """
         try:
-            # Try different move formats
+            # Pick the parser from the shape of the input
             move = None
             
-            # Try standard algebraic notation first
-            try:
-                move = self.board.parse_san(move_str)
-            except ValueError:
-                pass
-                
-            # Try UCI notation (e.g., e2e4)
-            if move is None:
+            if (len(move_str) in (4, 5) and move_str[0] in 'abcdefgh' and move_str[1] in '12345678'
+                    and move_str[2] in 'abcdefgh' and move_str[3] in '12345678'):
+                # UCI notation (e.g., e2e4)
                 try:
                     move = chess.Move.from_uci(move_str)
                 except ValueError:
                     pass
             
+            if move is None:
+                # Standard algebraic notation, also for UCI-shaped input the
+                # strict UCI parser rejects (e7e8Q, e2e4+)
+                try:
+                    move = self.board.parse_san(move_str)
+                except ValueError:
+                    pass
+            
             if move is None:
                 return False, f"Could not parse move: {move_str}"
                 
             # Check if move is legal
             if move not in self.board.legal_moves:
-                legal_moves = [self.board.san(m) for m in self.board.legal_moves]
-                return False, f"Illegal move. Legal moves: {', '.join(legal_moves[:10])}{'...' if len(legal_moves) > 10 else ''}"
+                # Only the listed moves need SAN formatting
+                legal_moves = list(self.board.legal_moves)
+                shown = [self.board.san(m) for m in legal_moves[:10]]
+                return False, f"Illegal move. Legal moves: {', '.join(shown)}{'...' if len(legal_moves) > 10 else ''}"
             
             # Make the move
-            self.board.push(move)
+            self._play_move(move)
             return True, f"Move {move_str} played successfully"
             
         except Exception as e:
@@ -89,33 +263,67 @@ class ChessEngine:
                 return None, "Game is over"
                 
             # Try to use Stockfish engine
-            stockfish_path = '/usr/games/stockfish'  # Default Ubuntu path
-            if not os.path.exists(stockfish_path):
-                stockfish_path = 'stockfish'  # Try system PATH
-                
-            with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-                # Configure engine for maximum strength
-                engine.configure({
-                    "Skill Level": 20,
-                    "Threads": 2,
-                    "Hash": 128,
-                    "MultiPV": 1,
-                    "UCI_LimitStrength": False,
-                    "UCI_Elo": 3200
-                })
+            engine = self._get_engine()
+            if engine:
                 # Extended thinking time for deeper analysis
-                result = engine.play(self.board, chess.engine.Limit(time=5.0, depth=15))
+                result = engine.play(self.board, chess.engine.Limit(time=5.0, depth=15), game=self._game)
                 
                 if result.move:
                     move_san = self.board.san(result.move)
+                    self._ai_move = (move_san, result.move)
                     return move_san, f"AI plays {move_san}"
+            else:
+                print("Stockfish not found, using built-in strategy")
                     
         except Exception as e:
             print(f"Stockfish engine error: {e}")
+            # Drop the engine so the next move starts a fresh process
+            self._close_engine()
             
         # Advanced fallback strategy - prioritize winning moves
         return self._get_strategic_move()
     
+    def _get_engine(self):
+        """
+        Get the running Stockfish engine, starting and configuring it once
+        Returns None if Stockfish is not installed
+        """
+        if self._engine is None and STOCKFISH_PATH:
+            engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
+            try:
+                # Configure engine for maximum strength
+                engine.configure({
+                    "Skill Level": 20,
+                    "Threads": 2,
+                    "Hash": 128,
+                    "MultiPV": 1,
+                    "UCI_LimitStrength": False,
+                    "UCI_Elo": 3200
+                })
+            except Exception:
+                engine.quit()
+                raise
+            self._engine = engine
+            atexit.register(self.close)
+        return self._engine
+    
+    def close(self):
+        """Shut down the Stockfish engine and close the opening book"""
+        self._close_engine()
+        book, self._book = self._book, None
+        if book is not None:
+            book.close()
+    
+    def _close_engine(self):
+        """Shut down the Stockfish engine if it is running"""
+        engine, self._engine = self._engine, None
+        if engine is not None:
+            atexit.unregister(self.close)
+            try:
+                engine.quit()
+            except Exception as e:
+                print(f"Error closing Stockfish engine: {e}")
+    
     def _get_strategic_move(self):
         """
         Ultra-advanced AI strategy designed to be unbeatable
@@ -125,55 +333,84 @@ class ChessEngine:
         if not legal_moves:
             return None, "No legal moves available"
         
+        # Game phase facts shared by the phases below, computed once per turn
+        move_stack_length = len(self.board.move_stack)
+        in_endgame = self._is_endgame()
+        
         # Phase 1: Critical tactical analysis
         critical_moves = self._find_critical_moves(legal_moves)
         if critical_moves:
-            return critical_moves
+            return self._announce_move(*critical_moves)
+        
+        # Polyglot opening book, probed ahead of the heuristics below since
+        # the positional phase always has a move to offer
+        if move_stack_length < 12:
+            book_move = self._get_polyglot_move()
+            if book_move:
+                return self._announce_move(*book_move)
         
         # Phase 2: Advanced positional evaluation
-        best_move = self._evaluate_positional_moves(legal_moves)
+        best_move = self._evaluate_positional_moves(legal_moves, move_stack_length)
         if best_move:
-            return best_move
+            return self._announce_move(*best_move)
         
         # Phase 3: Opening book knowledge
-        if len(self.board.move_stack) < 12:
-            opening_move = self._get_opening_book_move(legal_moves)
+        if move_stack_length < 12:
+            opening_move = self._get_opening_book_move(legal_moves, move_stack_length)
             if opening_move:
-                return opening_move
+                return self._announce_move(*opening_move)
         
         # Phase 4: Endgame specialization
-        if self._is_endgame():
+        if in_endgame:
             endgame_move = self._get_endgame_move(legal_moves)
             if endgame_move:
-                return endgame_move
+                return self._announce_move(*endgame_move)
         
         # Phase 5: Advanced evaluation with mini-max
-        return self._minimax_evaluation(legal_moves, depth=3)
+        return self._announce_move(*self._minimax_evaluation(legal_moves, depth=3))
+    
+    def _announce_move(self, move, reason):
+        """
+        Format a chosen move for the player
+        Phases return Move objects so SAN is only computed for the winner
+        """
+        move_san = self.board.san(move)
+        self._ai_move = (move_san, move)
+        return move_san, f"AI plays {move_san} - {reason}"
     
     def _find_critical_moves(self, legal_moves):
         """Find game-critical moves: checkmate, check escape, major threats"""
+        in_check = self.board.is_check()
+        
+        # Only checking moves can mate; after one, any legal reply means no mate
+        gives_check = self.board.gives_check
+        checking_moves = [move for move in legal_moves if gives_check(move)]
         
         # 1. Immediate checkmate
-        for move in legal_moves:
+        for move in checking_moves:
             self.board.push(move)
-            if self.board.is_checkmate():
-                move_san = self.board.san(move)
+            if not any(self.board.generate_legal_moves()):
                 self.board.pop()
-                return move_san, f"AI plays {move_san} - Checkmate!"
+                return move, "Checkmate!"
             self.board.pop()
         
-        # 2. Checkmate in 2 moves
-        for move in legal_moves:
+        # 2. Checkmate in 2 moves, probed only for checks that leave few replies
+        for move in checking_moves:
             self.board.push(move)
             opponent_moves = list(self.board.legal_moves)
+            if len(opponent_moves) > MATE_IN_2_MAX_REPLIES:
+                self.board.pop()
+                continue
             mate_in_2 = True
             for opp_move in opponent_moves:
                 self.board.push(opp_move)
                 ai_moves_2 = list(self.board.legal_moves)
                 has_mate = False
                 for ai_move_2 in ai_moves_2:
+                    if not self.board.gives_check(ai_move_2):
+                        continue
                     self.board.push(ai_move_2)
-                    if self.board.is_checkmate():
+                    if not any(self.board.generate_legal_moves()):
                         has_mate = True
                         self.board.pop()
                         break
@@ -184,11 +421,10 @@ class ChessEngine:
                     break
             self.board.pop()
             if mate_in_2 and opponent_moves:
-                move_san = self.board.san(move)
-                return move_san, f"AI plays {move_san} - Forced mate in 2!"
+                return move, "Forced mate in 2!"
         
         # 3. Defend against checkmate threats
-        if self.board.is_check():
+        if in_check:
             # Find best defense when in check
             defensive_moves = []
             for move in legal_moves:
@@ -200,10 +436,8 @@ class ChessEngine:
                 self.board.pop()
             
             if defensive_moves:
-                defensive_moves.sort(key=lambda x: x[1], reverse=True)
-                best_defense = defensive_moves[0][0]
-                move_san = self.board.san(best_defense)
-                return move_san, f"AI plays {move_san} - Defending!"
+                best_defense, _ = max(defensive_moves, key=itemgetter(1))
+                return best_defense, "Defending!"
         
         # 4. Win material with tactics
         tactical_moves = []
@@ -213,225 +447,418 @@ class ChessEngine:
                 tactical_moves.append((move, material_gain))
         
         if tactical_moves:
-            tactical_moves.sort(key=lambda x: x[1], reverse=True)
-            best_tactical = tactical_moves[0][0]
-            move_san = self.board.san(best_tactical)
-            return move_san, f"AI plays {move_san} - Wins material!"
+            best_tactical, _ = max(tactical_moves, key=itemgetter(1))
+            return best_tactical, "Wins material!"
         
         return None
     
-    def _evaluate_positional_moves(self, legal_moves):
+    def _evaluate_positional_moves(self, legal_moves, move_stack_length):
         """Advanced positional evaluation"""
+        board = self.board
+        bb_squares = chess.BB_SQUARES
+        # Every legal move belongs to the side to move
+        color = board.turn
         scored_moves = []
         
         for move in legal_moves:
             score = 0
-            piece = self.board.piece_at(move.from_square)
+            piece_type = board.piece_type_at(move.from_square)
+            from_bb = bb_squares[move.from_square]
+            to_bb = bb_squares[move.to_square]
             
             # Piece-square tables bonus
-            score += self._piece_square_value(piece, move.to_square)
+            score += self._piece_square_value(piece_type, color, move.to_square)
             
             # Center control
-            center_squares = [chess.D4, chess.D5, chess.E4, chess.E5]
-            if move.to_square in center_squares:
+            if to_bb & chess.BB_CENTER:
                 score += 30
             
             # Development bonus in opening
-            if len(self.board.move_stack) < 16:
-                if piece and piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-                    if move.from_square in [chess.B1, chess.G1, chess.C1, chess.F1]:  # Starting squares
+            if move_stack_length < 16:
+                if piece_type in (chess.KNIGHT, chess.BISHOP):
+                    if from_bb & BB_MINOR_HOME:  # Starting squares
                         score += 25
             
             # King safety
-            if piece and piece.piece_type == chess.KING:
-                if len(self.board.move_stack) < 20:  # Castling phase
-                    if move.to_square in [chess.G1, chess.C1]:  # Castling squares
+            if piece_type == chess.KING:
+                if move_stack_length < 20:  # Castling phase
+                    if to_bb & BB_CASTLED_KING:  # Castling squares
                         score += 50
             
-            # Control important squares
-            self.board.push(move)
-            controlled_squares = len(list(self.board.attacks(move.to_square)))
-            score += controlled_squares * 2
-            self.board.pop()
+            # Control important squares, from the occupancy after the move
+            if piece_type:
+                occupied = (board.occupied & ~from_bb) | to_bb
+                attacks = attacks_from(move.promotion or piece_type, color, move.to_square, occupied)
+                score += chess.popcount(attacks) * 2
             
             scored_moves.append((move, score))
         
         if scored_moves:
-            scored_moves.sort(key=lambda x: x[1], reverse=True)
-            best_positional = scored_moves[0][0]
-            move_san = self.board.san(best_positional)
-            return move_san, f"AI plays {move_san} - Positional advantage!"
+            best_positional, _ = max(scored_moves, key=itemgetter(1))
+            return best_positional, "Positional advantage!"
         
         return None
     
-    def _get_opening_book_move(self, legal_moves):
+    def _get_polyglot_move(self):
+        """Look the position up in the Polyglot book (only legal moves are returned)"""
+        if self._book is None:
+            return None
+        try:
+            return self._book.weighted_choice(self.board).move, "Opening theory!"
+        except IndexError:
+            return None
+    
+    def _get_opening_book_move(self, legal_moves, move_stack_length):
         """Opening book with strong theoretical moves"""
-        move_stack_length = len(self.board.move_stack)
+        if move_stack_length >= 12:
+            return None
         
-        # Respond to common openings with best theoretical moves
-        opening_responses = {
-            # Respond to 1.e4
-            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR": ["c5", "e5", "c6"],
-            # Respond to 1.d4  
-            "rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR": ["Nf6", "d5", "f5"],
-            # Italian Game response
-            "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R": ["f5", "Be7", "Nf6"]
-        }
-        
-        current_fen = self.board.fen().split()[0]  # Position only
-        if current_fen in opening_responses:
-            for response in opening_responses[current_fen]:
-                try:
-                    move = self.board.parse_san(response)
-                    if move in legal_moves:
-                        return response, f"AI plays {response} - Opening theory!"
-                except:
-                    continue
+        current_fen = self.board.board_fen()  # Position only
+        for move in OPENING_BOOK.get(current_fen, ()):
+            if move in legal_moves:
+                return move, "Opening theory!"
         
         # General opening principles
         if move_stack_length < 8:
             # Prioritize central pawn moves and piece development
+            piece_type_at = self.board.piece_type_at
+            bb_squares = chess.BB_SQUARES
             priority_moves = []
             for move in legal_moves:
-                piece = self.board.piece_at(move.from_square)
-                if piece:
-                    # Central pawn advances
-                    if piece.piece_type == chess.PAWN and move.to_square in [chess.D4, chess.D5, chess.E4, chess.E5]:
-                        priority_moves.append((move, 40))
-                    # Knight development
-                    elif piece.piece_type == chess.KNIGHT:
-                        good_squares = [chess.F3, chess.C3, chess.F6, chess.C6]
-                        if move.to_square in good_squares:
-                            priority_moves.append((move, 35))
-                    # Bishop development
-                    elif piece.piece_type == chess.BISHOP:
-                        good_squares = [chess.C4, chess.F4, chess.E2, chess.C5, chess.F5, chess.E7]
-                        if move.to_square in good_squares:
-                            priority_moves.append((move, 30))
+                piece_type = piece_type_at(move.from_square)
+                to_bb = bb_squares[move.to_square]
+                # Central pawn advances
+                if piece_type == chess.PAWN and to_bb & chess.BB_CENTER:
+                    priority_moves.append((move, 40))
+                # Knight development
+                elif piece_type == chess.KNIGHT:
+                    if to_bb & BB_KNIGHT_DEVELOPED:
+                        priority_moves.append((move, 35))
+                # Bishop development
+                elif piece_type == chess.BISHOP:
+                    if to_bb & BB_BISHOP_DEVELOPED:
+                        priority_moves.append((move, 30))
             
             if priority_moves:
-                priority_moves.sort(key=lambda x: x[1], reverse=True)
-                best_opening = priority_moves[0][0]
-                move_san = self.board.san(best_opening)
-                return move_san, f"AI plays {move_san} - Opening principles!"
+                best_opening, _ = max(priority_moves, key=itemgetter(1))
+                return best_opening, "Opening principles!"
         
         return None
     
     def _is_endgame(self):
         """Determine if we're in endgame phase"""
-        piece_count = len([sq for sq in chess.SQUARES if self.board.piece_at(sq) is not None])
-        return piece_count <= 12 or (piece_count <= 16 and not any([
-            self.board.pieces(chess.QUEEN, chess.WHITE),
-            self.board.pieces(chess.QUEEN, chess.BLACK)
-        ]))
+        piece_count = chess.popcount(self.board.occupied)
+        return piece_count <= 12 or (piece_count <= 16 and not self.board.queens)
     
     def _get_endgame_move(self, legal_moves):
         """Specialized endgame play"""
         # King activity in endgame
+        piece_type_at = self.board.piece_type_at
+        color = self.board.turn
         scored_moves = []
         for move in legal_moves:
             score = 0
-            piece = self.board.piece_at(move.from_square)
+            piece_type = piece_type_at(move.from_square)
+            to_rank = move.to_square >> 3
             
-            if piece and piece.piece_type == chess.KING:
+            if piece_type == chess.KING:
                 # Activate king in endgame
-                king_advancement = chess.square_rank(move.to_square) if piece.color else 7 - chess.square_rank(move.to_square)
+                king_advancement = to_rank if color else 7 - to_rank
                 score += king_advancement * 10
                 
                 # Centralize king
-                center_distance = abs(chess.square_file(move.to_square) - 3.5) + abs(chess.square_rank(move.to_square) - 3.5)
-                score += (7 - center_distance) * 5
+                score += (7 - CENTER_DIST[move.to_square]) * 5
             
             # Pawn promotion race
-            if piece and piece.piece_type == chess.PAWN:
-                promotion_distance = 7 - chess.square_rank(move.to_square) if piece.color else chess.square_rank(move.to_square)
+            if piece_type == chess.PAWN:
+                promotion_distance = 7 - to_rank if color else to_rank
                 score += (7 - promotion_distance) * 15
             
             scored_moves.append((move, score))
         
         if scored_moves:
-            scored_moves.sort(key=lambda x: x[1], reverse=True)
-            best_endgame = scored_moves[0][0]
-            move_san = self.board.san(best_endgame)
-            return move_san, f"AI plays {move_san} - Endgame technique!"
+            best_endgame, _ = max(scored_moves, key=itemgetter(1))
+            return best_endgame, "Endgame technique!"
         
         return None
     
+    def _push(self, move):
+        """Push a move while updating the search hash incrementally"""
+        board = self.board
+        h = self._hash
+        self._hash_stack.append(h)
+        
+        if board.is_castling(move):
+            # Rare enough to simply rehash from scratch
+            board.push(move)
+            self._hash = chess.polyglot.zobrist_hash(board)
+            return
+        
+        color = board.turn
+        from_square = move.from_square
+        to_square = move.to_square
+        piece_type = board.piece_type_at(from_square)
+        
+        # Castling and en passant keys are replaced after the move
+        h ^= _zobrist_hasher.hash_castling(board) ^ _zobrist_hasher.hash_ep_square(board)
+        
+        h ^= ZOBRIST[64 * ((piece_type - 1) * 2 + color) + from_square]
+        h ^= ZOBRIST[64 * (((move.promotion or piece_type) - 1) * 2 + color) + to_square]
+        
+        captured_type = board.piece_type_at(to_square)
+        if captured_type:
+            h ^= ZOBRIST[64 * ((captured_type - 1) * 2 + (not color)) + to_square]
+        elif piece_type == chess.PAWN and to_square == board.ep_square:
+            captured_square = to_square - 8 if color else to_square + 8
+            h ^= ZOBRIST[64 * (not color) + captured_square]
+        
+        board.push(move)
+        self._hash = (h ^ ZOBRIST_TURN ^
+                      _zobrist_hasher.hash_castling(board) ^ _zobrist_hasher.hash_ep_square(board))
+    
+    def _pop(self):
+        """Pop a move pushed with _push, restoring the previous hash"""
+        self.board.pop()
+        self._hash = self._hash_stack.pop()
+    
+    def _order_moves(self, moves, tt_move):
+        """
+        Order moves so alpha-beta cuts early: the TT move, then captures by
+        MVV-LVA (most valuable victim, least valuable attacker) and promotions
+        Returns a new list
+        """
+        board = self.board
+        piece_type_at = board.piece_type_at
+        bb_squares = chess.BB_SQUARES
+        # Plain bitboard tests, so quiet moves never look up a piece type
+        them = board.occupied_co[not board.turn]
+        pawns = board.pawns
+        ep_square = board.ep_square
+        
+        def score(move):
+            to_square = move.to_square
+            value = 1000000 if move == tt_move else 0
+            if bb_squares[to_square] & them:
+                value += MVV_LVA[piece_type_at(to_square)][piece_type_at(move.from_square)]
+            elif to_square == ep_square and bb_squares[move.from_square] & pawns:
+                value += MVV_LVA[chess.PAWN][chess.PAWN]
+            if move.promotion:
+                value += 800
+            return value
+        
+        return sorted(moves, key=score, reverse=True)
+    
     def _minimax_evaluation(self, legal_moves, depth=3):
-        """Simplified minimax with alpha-beta pruning concepts"""
-        best_score = float('-inf')
+        """
+        Iterative deepening minimax with alpha-beta pruning and PV move ordering
+        Each iteration first searches a narrow aspiration window around the
+        previous score and widens it only if the result falls outside
+        """
+        deadline = time.monotonic() + SEARCH_TIME_LIMIT
+        root_moves = self._order_moves(legal_moves, None)
         best_move = None
-        
-        for move in legal_moves:
-            self.board.push(move)
-            score = self._evaluate_position() - self._minimax_helper(depth - 1, False, float('-inf'), float('inf'))
-            self.board.pop()
+        prev_score = None
+        
+        # Stored bounds depend on which side maximizes, so entries from a
+        # search rooted at the other colour cannot be reused
+        if self._tt_color != self.board.turn:
+            self.tt.clear()
+            self._tt_color = self.board.turn
+        
+        # Hash the root once; _push/_pop keep it current below
+        self._hash = chess.polyglot.zobrist_hash(self.board)
+        self._hash_stack = []
+        
+        for current_depth in range(1, depth + 1):
+            # Try the previous iteration's best move first
+            if best_move is not None:
+                root_moves.remove(best_move)
+                root_moves.insert(0, best_move)
             
-            if score > best_score:
-                best_score = score
-                best_move = move
+            if prev_score is None:
+                alpha, beta = float('-inf'), float('inf')
+            else:
+                alpha, beta = prev_score - ASPIRATION_WINDOW, prev_score + ASPIRATION_WINDOW
+            
+            result = self._search_root(root_moves, current_depth, alpha, beta, deadline)
+            if result is not None and not alpha < result[0] < beta:
+                # Failed high or low: re-search with the full window
+                result = self._search_root(root_moves, current_depth, float('-inf'), float('inf'), deadline)
+            
+            # Abandon an unfinished iteration once the budget is spent
+            if result is None:
+                break
+            prev_score, best_move = result
+            
+            if time.monotonic() > deadline:
+                break
         
         if best_move:
-            move_san = self.board.san(best_move)
-            return move_san, f"AI plays {move_san} - Deep calculation!"
+            return best_move, "Deep calculation!"
         
         # Fallback
         import random
-        move = random.choice(legal_moves)
-        move_san = self.board.san(move)
-        return move_san, f"AI plays {move_san} - Strategic!"
+        return random.choice(legal_moves), "Strategic!"
+    
+    def _search_root(self, root_moves, depth, alpha, beta, deadline):
+        """
+        Search the root moves within the (alpha, beta) score window
+        Returns (score, move), stopping early on a score >= beta, or None
+        if the deadline passed before a deeper-than-one search finished
+        """
+        best_score = float('-inf')
+        best_move = None
+        for move in root_moves:
+            if depth > 1 and time.monotonic() > deadline:
+                return None
+            
+            # A root score is the static score minus the reply search, so the
+            # window maps onto the reply search reversed
+            self._push(move)
+            static_score = self._evaluate_position()
+            score = static_score - self._minimax_helper(
+                depth - 1, False, static_score - beta, static_score - max(alpha, best_score))
+            self._pop()
+            
+            if score > best_score:
+                best_score = score
+                best_move = move
+                if score >= beta:
+                    break
+        
+        return best_score, best_move
     
     def _minimax_helper(self, depth, maximizing, alpha, beta):
-        """Minimax helper with pruning"""
-        if depth == 0 or self.board.is_game_over():
-            return self._evaluate_position()
+        """Minimax helper with pruning and a transposition table"""
+        alpha_orig = alpha
+        beta_orig = beta
+        
+        # Probe the transposition table
+        key = self._hash
+        slot = key & (TT_SIZE - 1)
+        entry = self.tt.get(slot)
+        if entry is not None and entry[0] == key and entry[1] >= depth:
+            _, _, tt_value, tt_flag, _ = entry
+            if tt_flag == TT_EXACT:
+                return tt_value
+            elif tt_flag == TT_LOWER:
+                alpha = max(alpha, tt_value)
+            else:
+                beta = min(beta, tt_value)
+            if beta <= alpha:
+                return tt_value
+        
+        if depth == 0:
+            return self._qsearch(maximizing, alpha, beta)
         
+        # Generate moves once and reuse them for the game-over test
         legal_moves = list(self.board.legal_moves)
+        if (not legal_moves or self.board.is_insufficient_material()
+                or self.board.is_seventyfive_moves() or self.board.is_fivefold_repetition()):
+            return self._evaluate_position()
+        best_move = None
+        
+        # Search the stored best move first, then captures
+        tt_move = entry[4] if entry is not None and entry[0] == key else None
+        legal_moves = self._order_moves(legal_moves, tt_move)
         
         if maximizing:
-            max_eval = float('-inf')
-            for move in legal_moves[:8]:  # Limit for performance
-                self.board.push(move)
+            best_eval = float('-inf')
+            for move in legal_moves:
+                self._push(move)
                 eval_score = self._minimax_helper(depth - 1, False, alpha, beta)
-                self.board.pop()
-                max_eval = max(max_eval, eval_score)
+                self._pop()
+                if eval_score > best_eval:
+                    best_eval = eval_score
+                    best_move = move
                 alpha = max(alpha, eval_score)
                 if beta <= alpha:
                     break
-            return max_eval
         else:
-            min_eval = float('inf')
-            for move in legal_moves[:8]:  # Limit for performance
-                self.board.push(move)
+            best_eval = float('inf')
+            for move in legal_moves:
+                self._push(move)
                 eval_score = self._minimax_helper(depth - 1, True, alpha, beta)
-                self.board.pop()
-                min_eval = min(min_eval, eval_score)
+                self._pop()
+                if eval_score < best_eval:
+                    best_eval = eval_score
+                    best_move = move
                 beta = min(beta, eval_score)
                 if beta <= alpha:
                     break
-            return min_eval
+        
+        # Store the result with the kind of bound it proves, keeping a
+        # deeper entry already in the slot (depth-preferred replacement)
+        if best_eval <= alpha_orig:
+            flag = TT_UPPER
+        elif best_eval >= beta_orig:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        old = self.tt.get(slot)
+        if old is None or depth >= old[1]:
+            self.tt[slot] = (key, depth, best_eval, flag, best_move)
+        
+        return best_eval
+    
+    def _qsearch(self, maximizing, alpha, beta):
+        """
+        Quiescence search: extend captures until the position is quiet, so
+        leaves are never scored in the middle of an exchange
+        """
+        stand_pat = self._evaluate_position()
+        if maximizing:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+        best_eval = stand_pat
+        
+        board = self.board
+        captures = list(board.generate_legal_captures())
+        # Captures leave the search hash untouched; nothing below probes it
+        for move in self._order_moves(captures, None):
+            board.push(move)
+            eval_score = self._qsearch(not maximizing, alpha, beta)
+            board.pop()
+            if maximizing:
+                if eval_score > best_eval:
+                    best_eval = eval_score
+                alpha = max(alpha, eval_score)
+            else:
+                if eval_score < best_eval:
+                    best_eval = eval_score
+                beta = min(beta, eval_score)
+            if beta <= alpha:
+                break
+        
+        return best_eval
     
     def _evaluate_position(self):
         """Comprehensive position evaluation"""
-        if self.board.is_checkmate():
-            return -10000 if self.board.turn else 10000
-        if self.board.is_stalemate() or self.board.is_insufficient_material():
-            return 0
+        board = self.board
         
-        score = 0
-        piece_values = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, 
-                       chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+        # One move count serves the mate/stalemate test and mobility
+        mobility = self._evaluate_piece_mobility()
+        if not mobility:
+            if board.is_check():
+                return -10000 if board.turn else 10000
+            return 0
+        if board.is_insufficient_material():
+            return 0
         
-        # Material count
-        for square in chess.SQUARES:
-            piece = self.board.piece_at(square)
-            if piece:
-                value = piece_values[piece.piece_type]
-                score += value if piece.color else -value
+        # Material count from piece bitboards
+        score = material_balance(
+            board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK],
+            board.pawns, board.knights, board.bishops, board.rooks, board.queens
+        )
         
         # Positional factors
         score += self._evaluate_king_safety() * 20
-        score += self._evaluate_piece_mobility() * 10
+        score += mobility * 10
         
         return score
     
@@ -443,52 +870,81 @@ class ChessEngine:
     
     def _evaluate_piece_mobility(self):
         """Evaluate piece mobility"""
-        mobility = len(list(self.board.legal_moves))
-        return mobility
+        return self.board.legal_moves.count()
     
     def _calculate_material_gain(self, move):
-        """Calculate material gained from a move"""
-        if not self.board.is_capture(move):
+        """
+        Calculate material gained from a capture once all recaptures on the
+        square are played out (static exchange evaluation)
+        """
+        board = self.board
+        if not board.is_capture(move):
             return 0
         
-        captured_piece = self.board.piece_at(move.to_square)
-        if captured_piece:
-            piece_values = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, 
-                           chess.ROOK: 5, chess.QUEEN: 9}
-            return piece_values.get(captured_piece.piece_type, 0)
-        return 0
+        square = move.to_square
+        occupied = board.occupied & ~chess.BB_SQUARES[move.from_square]
+        if board.is_en_passant(move):
+            victim = chess.PAWN
+            occupied &= ~chess.BB_SQUARES[square ^ 8]
+        else:
+            victim = board.piece_type_at(square)
+        
+        gains = [SEE_VALUES[victim]]
+        piece_value = SEE_VALUES[move.promotion or board.piece_type_at(move.from_square)]
+        side = not board.turn
+        
+        # Alternate captures with the least valuable attacker, revealing x-rays
+        while True:
+            attackers = board.attackers_mask(side, square, occupied) & occupied
+            if not attackers:
+                break
+            attacker = min(chess.scan_forward(attackers), key=board.piece_type_at)
+            gains.append(piece_value - gains[-1])
+            piece_value = SEE_VALUES[board.piece_type_at(attacker)]
+            occupied &= ~chess.BB_SQUARES[attacker]
+            side = not side
+        
+        # Either side may stop capturing when continuing would lose material
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+        return gains[0]
     
-    def _piece_square_value(self, piece, square):
+    def _piece_square_value(self, piece_type, color, square):
         """Get piece-square table value"""
-        if not piece:
+        if not piece_type:
             return 0
-        # Simplified piece-square evaluation
-        rank = chess.square_rank(square)
-        file = chess.square_file(square)
-        
-        if piece.piece_type == chess.PAWN:
-            return rank * 5 if piece.color else (7 - rank) * 5
-        elif piece.piece_type in [chess.KNIGHT, chess.BISHOP]:
-            center_distance = abs(file - 3.5) + abs(rank - 3.5)
-            return int(10 - center_distance * 2)
         
-        return 0
+        # square ^ 56 is chess.square_mirror(square)
+        return PST[piece_type][square if color else square ^ 56]
     
     def make_ai_move(self, move_str):
         """Make AI move on the board"""
         try:
-            # Try to parse as SAN first
-            move = self.board.parse_san(move_str)
-            if move in self.board.legal_moves:
-                self.board.push(move)
+            # Reuse the move behind the SAN get_ai_move just returned
+            ai_move, self._ai_move = self._ai_move, None
+            if ai_move is not None and ai_move[0] == move_str and self.board.is_legal(ai_move[1]):
+                self._play_move(ai_move[1], move_str)
                 return True
-            else:
-                print(f"Illegal AI move attempted: {move_str}")
-                return False
+            
+            # parse_san only returns legal moves and raises otherwise
+            move = self.board.parse_san(move_str)
+            self._play_move(move)
+            return True
+        except ValueError:
+            print(f"Illegal AI move attempted: {move_str}")
+            return False
         except Exception as e:
             print(f"Error making AI move {move_str}: {e}")
             return False
     
+    def _play_move(self, move, move_san=None):
+        """Push a game move, recording its SAN for get_last_moves"""
+        board = self.board
+        if move_san is None:
+            move_san = board.san(move)
+        self.san_history.append((board.fullmove_number, board.turn, move_san))
+        board.push(move)
+    
     def get_game_status(self):
         """Get current game status"""
         if self.board.is_checkmate():
@@ -515,16 +971,14 @@ class ChessEngine:
     def get_last_moves(self, count=5):
         """Get last N moves in algebraic notation"""
         moves = []
-        board_copy = chess.Board()
         
-        for i, move in enumerate(self.board.move_stack[-count*2:]):
-            move_san = board_copy.san(move)
-            board_copy.push(move)
-            
-            move_number = (len(self.board.move_stack) - len(self.board.move_stack[-count*2:]) + i) // 2 + 1
-            
-            if i % 2 == 0:  # White move
+        # SAN was recorded as each move was played, so only the tail is read
+        tail = self.san_history[-count * 2:] if count > 0 else []
+        for i, (move_number, white_moved, move_san) in enumerate(tail):
+            if white_moved:  # White move
                 moves.append(f"{move_number}. {move_san}")
+            elif i == 0:  # Black move opening the list
+                moves.append(f"{move_number}... {move_san}")
             else:  # Black move
                 moves.append(f"{move_san}")
                 
@@ -533,11 +987,15 @@ class ChessEngine:
     def reset_game(self):
         """Reset the game to starting position"""
         self.board = chess.Board()
+        self.san_history = []
+        self._game = object()
         self.save_game_state()
         
-        # Clear PGN history
+        # Clear PGN history, including moves not yet written out
+        discard_pgn()
         try:
-            with open('game_history.pgn', 'w') as f:
-                f.write("")
+            os.truncate('game_history.pgn', 0)
+        except FileNotFoundError:
+            pass
         except Exception as e:
             print(f"Error clearing PGN: {e}")
@@ -3,24 +3,43 @@
 Game statistics and leaderboard management for GitHub Chess
 """
 
+import atexit
+import heapq
 import json
 import os
+import time
 from datetime import datetime
 from collections import defaultdict
 import chess
 
+# Minimum seconds between stats file writes while moves are being recorded
+STATS_FLUSH_INTERVAL = 2.0
+
+# Seconds a formatted timestamp is reused before the clock is read again
+TIMESTAMP_RESOLUTION = 1.0
+
 class GameStats:
     def __init__(self):
         """Initialize game statistics manager"""
         self.stats_file = 'game_stats.json'
+        self._now_str = None
+        self._now_ts = 0.0
         self.load_stats()
+        
+        # Recorded changes are written in batches; see maybe_flush()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
     
     def load_stats(self):
         """Load game statistics from file"""
         try:
+            # Hash of the content last written to disk, see save_stats()
+            self._saved_hash = None
             if os.path.exists(self.stats_file):
                 with open(self.stats_file, 'r') as f:
                     self.stats = json.load(f)
+                self._saved_hash = hash(self._content_json())
             else:
                 self.stats = {
                     'players': {},
@@ -30,12 +49,20 @@ class GameStats:
                     'ai_wins': 0,
                     'player_wins': 0,
                     'draws': 0,
-                    'last_updated': datetime.now().isoformat()
+                    'last_updated': self._now()
                 }
         except Exception as e:
             print(f"Error loading stats: {e}")
             self.stats = self._get_default_stats()
     
+    def _now(self):
+        """Current time as an ISO string, refreshed at most once per TIMESTAMP_RESOLUTION"""
+        ts = time.monotonic()
+        if self._now_str is None or ts - self._now_ts > TIMESTAMP_RESOLUTION:
+            self._now_str = datetime.now().isoformat()
+            self._now_ts = ts
+        return self._now_str
+    
     def _get_default_stats(self):
         """Get default stats structure"""
         return {
@@ -46,18 +73,50 @@ class GameStats:
             'ai_wins': 0,
             'player_wins': 0,
             'draws': 0,
-            'last_updated': datetime.now().isoformat()
+            'last_updated': self._now()
         }
     
+    def _content_json(self):
+        """Statistics serialized as JSON, without the last_updated timestamp"""
+        content = {key: value for key, value in self.stats.items() if key != 'last_updated'}
+        return json.dumps(content)
+    
     def save_stats(self):
-        """Save statistics to file"""
+        """Save statistics to file atomically, skipping the write if nothing changed"""
         try:
-            self.stats['last_updated'] = datetime.now().isoformat()
-            with open(self.stats_file, 'w') as f:
-                json.dump(self.stats, f, indent=2)
+            content = self._content_json()
+            content_hash = hash(content)
+            if content_hash != self._saved_hash:
+                self.stats['last_updated'] = self._now()
+                
+                # Reuse the serialized content, appending the timestamp to it
+                last_updated = f'"last_updated": {json.dumps(self.stats["last_updated"])}'
+                if content == '{}':
+                    content = '{' + last_updated + '}'
+                else:
+                    content = content[:-1] + ', ' + last_updated + '}'
+                
+                tmp_file = f"{self.stats_file}.tmp"
+                with open(tmp_file, 'w') as f:
+                    f.write(content)
+                os.replace(tmp_file, self.stats_file)
+                self._saved_hash = content_hash
+            self._dirty = False
+            self._last_flush = time.monotonic()
         except Exception as e:
             print(f"Error saving stats: {e}")
     
+    def flush(self):
+        """Save statistics if anything changed since the last save"""
+        if self._dirty:
+            self.save_stats()
+    
+    def maybe_flush(self):
+        """Mark statistics changed and save them if the last save is old enough"""
+        self._dirty = True
+        if time.monotonic() - self._last_flush >= STATS_FLUSH_INTERVAL:
+            self.save_stats()
+    
     def record_move(self, player, move, move_quality="normal"):
         """Record a player move"""
         if player not in self.stats['players']:
@@ -69,15 +128,15 @@ class GameStats:
                 'draws': 0,
                 'brilliant_moves': 0,
                 'blunders': 0,
-                'first_game': datetime.now().isoformat(),
-                'last_active': datetime.now().isoformat(),
+                'first_game': self._now(),
+                'last_active': self._now(),
                 'favorite_openings': {},
                 'total_score': 0
             }
         
         player_stats = self.stats['players'][player]
         player_stats['moves_played'] += 1
-        player_stats['last_active'] = datetime.now().isoformat()
+        player_stats['last_active'] = self._now()
         
         # Track move quality
         if move_quality == "brilliant":
@@ -90,7 +149,7 @@ class GameStats:
             player_stats['total_score'] += 1
         
         self.stats['total_moves'] += 1
-        self.save_stats()
+        self.maybe_flush()
     
     def record_game_start(self, player):
         """Record when a player starts/joins a game"""
@@ -98,7 +157,7 @@ class GameStats:
             self.record_move(player, "", "normal")  # Initialize player
         
         self.stats['players'][player]['games_participated'] += 1
-        self.save_stats()
+        self.maybe_flush()
     
     def record_game_end(self, winner, players_involved):
         """Record game completion"""
@@ -126,23 +185,34 @@ class GameStats:
         
         # Record game in history
         game_record = {
-            'date': datetime.now().isoformat(),
+            'date': self._now(),
             'players': players_involved,
             'winner': winner,
             'total_moves': self.stats['total_moves']
         }
         self.stats['games'].append(game_record)
         
+        # Always persist finished games right away
         self.save_stats()
     
+    def _win_rate(self, stats):
+        """Win rate of a player's stats, counting draws as half a win"""
+        if stats['games_participated'] > 0:
+            return (stats['wins'] + 0.5 * stats['draws']) / stats['games_participated']
+        return 0
+    
     def get_leaderboard(self, limit=10):
         """Get top players leaderboard"""
+        win_rate_of = self._win_rate
+        
+        # Rank by score, then by win rate, and only build rows for the top players
+        top = heapq.nlargest(
+            limit, self.stats['players'].items(),
+            key=lambda item: (item[1]['total_score'], win_rate_of(item[1]))
+        )
+        
         players = []
-        for username, stats in self.stats['players'].items():
-            win_rate = 0
-            if stats['games_participated'] > 0:
-                win_rate = (stats['wins'] + 0.5 * stats['draws']) / stats['games_participated']
-            
+        for username, stats in top:
             player_data = {
                 'username': username,
                 'score': stats['total_score'],
@@ -151,16 +221,14 @@ class GameStats:
                 'draws': stats['draws'],
                 'games': stats['games_participated'],
                 'moves': stats['moves_played'],
-                'win_rate': win_rate,
+                'win_rate': win_rate_of(stats),
                 'brilliant_moves': stats['brilliant_moves'],
                 'blunders': stats['blunders'],
                 'last_active': stats['last_active']
             }
             players.append(player_data)
         
-        # Sort by score, then by win rate
-        players.sort(key=lambda x: (x['score'], x['win_rate']), reverse=True)
-        return players[:limit]
+        return players
 
 
 
@@ -227,9 +295,7 @@ class GameStats:
             achievements.append("🏅 Champion - 10+ victories")
         
         # Special achievements
-        win_rate = 0
-        if stats['games_participated'] > 0:
-            win_rate = (stats['wins'] + 0.5 * stats['draws']) / stats['games_participated']
+        win_rate = self._win_rate(stats)
         
         if win_rate >= 0.7 and stats['games_participated'] >= 5:
             achievements.append("⭐ High Performer - 70%+ win rate")
@@ -280,4 +346,4 @@ class GameStats:
         
         openings = self.stats['players'][player].setdefault('favorite_openings', {})
         openings[opening_name] = openings.get(opening_name, 0) + 1
-        self.save_stats()
\ No newline at end of file
+        self.maybe_flush()
\ No newline at end of file
@@ -6,55 +6,143 @@ Main script to process chess moves from GitHub Issues
 import os
 import sys
 import re
-from github import Github
-from chess_engine import ChessEngine
-from board_generator import BoardGenerator
-from utils import update_readme, log_move
-from game_stats import GameStats
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+# Comments on and closes an issue in a single GraphQL request
+FINALIZE_ISSUE_MUTATION = """
+mutation($id: ID!, $body: String!) {
+  addComment(input: {subjectId: $id, body: $body}) { clientMutationId }
+  closeIssue(input: {issueId: $id}) { clientMutationId }
+}
+"""
+
+# Connection pool size and retry policy for GitHub API calls
+GITHUB_POOL_SIZE = 4
+GITHUB_RETRY_TOTAL = 3
+GITHUB_RETRY_BACKOFF = 0.3
+GITHUB_RETRY_STATUSES = (429, 502, 503, 504)
+
+# Issue title patterns, compiled once
+RESET_PATTERN = re.compile(r'Move:\s*reset', re.IGNORECASE)
+MOVE_PATTERN = re.compile(r'Move:\s*([a-h][1-8][a-h][1-8][qrnb]?|[KQRNB][a-h1-8]*[a-h][1-8]|O-O-O|O-O|[a-h]x[a-h][1-8])', re.IGNORECASE)
+
+@lru_cache(maxsize=256)
 def extract_move_from_title(title):
     """Extract chess move from issue title"""
     # Check for reset command first
-    if re.search(r'Move:\s*reset', title, re.IGNORECASE):
+    if RESET_PATTERN.search(title):
         return "reset"
     
     # Match patterns like "Move: e2e4", "Move: Nf3", "Move: O-O", etc.
-    match = re.search(r'Move:\s*([a-h][1-8][a-h][1-8][qrnb]?|[KQRNB][a-h1-8]*[a-h][1-8]|O-O-O|O-O|[a-h]x[a-h][1-8])', title, re.IGNORECASE)
+    match = MOVE_PATTERN.search(title)
     if match:
-        return match.group(1).strip()
+        return match.group(1)
     return None
 
-def comment_on_issue(github_client, repo_name, issue_number, comment):
-    """Add a comment to the GitHub issue"""
+def get_issue(github_client, repo_name, issue_number):
+    """Fetch the GitHub issue once, or None if it cannot be fetched"""
     try:
         repo = github_client.get_repo(repo_name)
-        issue = repo.get_issue(issue_number)
+        return repo.get_issue(issue_number)
+    except Exception as e:
+        print(f"Error fetching issue: {e}")
+        return None
+
+def comment_on_issue(issue, comment):
+    """Add a comment to the GitHub issue"""
+    if issue is None:
+        return False
+    try:
         issue.create_comment(comment)
         return True
     except Exception as e:
         print(f"Error commenting on issue: {e}")
         return False
 
-def close_issue(github_client, repo_name, issue_number):
+def close_issue(issue):
     """Close the GitHub issue"""
+    if issue is None:
+        return False
     try:
-        repo = github_client.get_repo(repo_name)
-        issue = repo.get_issue(issue_number)
         issue.edit(state='closed')
         return True
     except Exception as e:
         print(f"Error closing issue: {e}")
         return False
 
+def get_finalized_state(issue, comment):
+    """
+    Re-read the issue to see what an interrupted finalize_issue already did
+    Returns (commented, closed), or None if the issue could not be read
+    """
+    try:
+        issue.update()
+        closed = issue.state == 'closed'
+        commented = any(c.body == comment for c in issue.get_comments())
+        return commented, closed
+    except Exception as e:
+        print(f"Error re-reading issue: {e}")
+        return None
+
+def finalize_issue(issue, comment):
+    """Comment on the GitHub issue and close it, in one API request when possible"""
+    if issue is None:
+        return False
+    from github import GithubException
+    
+    commented = closed = False
+    try:
+        _, data = issue._requester.requestJsonAndCheck(
+            "POST", "/graphql",
+            input={"query": FINALIZE_ISSUE_MUTATION, "variables": {"id": issue.node_id, "body": comment}}
+        )
+        if not data.get('errors'):
+            return True
+        print(f"Error finalizing issue: {data['errors']}")
+        
+        # Either half of the mutation may still have gone through
+        result = data.get('data') or {}
+        commented = result.get('addComment') is not None
+        closed = result.get('closeIssue') is not None
+    except GithubException as e:
+        # GitHub answered with an error status, so nothing was applied
+        print(f"Error finalizing issue: {e}")
+    except Exception as e:
+        print(f"Error finalizing issue: {e}")
+        
+        # The connection failed without an answer, possibly after the
+        # mutation went through; check before repeating any of it
+        state = get_finalized_state(issue, comment)
+        if state is None:
+            return False
+        commented, closed = state
+        if commented and closed:
+            return True
+    
+    # Fall back to the separate REST calls for whatever did not happen;
+    # they are independent, so both go out at once
+    if not commented and not closed:
+        with ThreadPoolExecutor(2) as executor:
+            comment_result = executor.submit(comment_on_issue, issue, comment)
+            close_result = executor.submit(close_issue, issue)
+            return comment_result.result() and close_result.result()
+    if not commented:
+        commented = comment_on_issue(issue, comment)
+    if not closed:
+        closed = close_issue(issue)
+    return commented and closed
+
 def main():
     # Get environment variables
-    github_token = os.getenv('GITHUB_TOKEN')
-    issue_number_str = os.getenv('ISSUE_NUMBER')
-    issue_title = os.getenv('ISSUE_TITLE')
-    issue_author = os.getenv('ISSUE_AUTHOR')
-    repository = os.getenv('REPOSITORY')
+    env = os.environ
+    github_token = env.get('GITHUB_TOKEN')
+    issue_number_str = env.get('ISSUE_NUMBER')
+    issue_title = env.get('ISSUE_TITLE')
+    issue_author = env.get('ISSUE_AUTHOR')
+    repository = env.get('REPOSITORY')
     
-    if not all([github_token, issue_number_str, issue_title, repository]):
+    if not (github_token and issue_number_str and issue_title and repository):
         print("Missing required environment variables")
         sys.exit(1)
     
@@ -68,37 +156,55 @@ def main():
         print("Invalid issue number")
         sys.exit(1)
     
-    # Initialize GitHub client
-    github_client = Github(github_token)
+    # Heavy imports wait until the input is known to be usable
+    from github import Github
+    from urllib3.util.retry import Retry
+    
+    # Initialize GitHub client and fetch the issue once for all replies
+    github_client = Github(
+        github_token,
+        pool_size=GITHUB_POOL_SIZE,
+        retry=Retry(
+            total=GITHUB_RETRY_TOTAL,
+            backoff_factor=GITHUB_RETRY_BACKOFF,
+            status_forcelist=GITHUB_RETRY_STATUSES
+        )
+    )
+    issue = get_issue(github_client, repository, issue_number)
     
     # Extract move from issue title
     player_move = extract_move_from_title(issue_title)
     if not player_move:
         comment = f"❌ **Invalid move format!**\n\nPlease use the format: `Move: e2e4` (standard algebraic notation)\n\nExamples:\n- `Move: e2e4` (pawn move)\n- `Move: Nf3` (knight move)\n- `Move: O-O` (castling)\n- `Move: Qxd7+` (queen captures with check)\n- `Move: reset` (start new game)"
-        comment_on_issue(github_client, repository, issue_number, comment)
-        close_issue(github_client, repository, issue_number)
+        finalize_issue(issue, comment)
         return
     
     print(f"Processing move: {player_move} by {issue_author}")
     
+    # The engine side is only needed once there is a move to play
+    import chess
+    from chess_engine import ChessEngine
+    from board_generator import get_default_generator
+    from game_stats import GameStats
+    from utils import update_readme, log_move, flush_logs
+    
     # Initialize chess engine
     engine = ChessEngine()
     
     # Handle reset command
-    if player_move.lower() == "reset":
+    if player_move == "reset":
         try:
             engine.reset_game()
             
             # Generate new board
-            board_gen = BoardGenerator()
-            board_gen.generate_board_svg(engine.board)
+            board_gen = get_default_generator()
+            board_gen.write_svg(engine.board)
             
             # Update README
             update_readme(engine)
             
             comment = f"🔄 **Game Reset!**\n\n{issue_author} has started a new chess game!\n\nThe board has been reset to the starting position. White to move first!\n\nCheck the updated board in the README and make your opening move!"
-            comment_on_issue(github_client, repository, issue_number, comment)
-            close_issue(github_client, repository, issue_number)
+            finalize_issue(issue, comment)
             
             log_move(f"{issue_author}: Game reset")
             print("Game reset successfully")
@@ -106,8 +212,7 @@ def main():
             
         except Exception as e:
             error_comment = f"❌ **Error resetting game**\n\nThere was an unexpected error: {str(e)}\n\nPlease try again or report this issue."
-            comment_on_issue(github_client, repository, issue_number, error_comment)
-            close_issue(github_client, repository, issue_number)
+            finalize_issue(issue, error_comment)
             print(f"Error resetting game: {e}")
             return
     
@@ -117,8 +222,7 @@ def main():
         
         if not success:
             comment = f"❌ **Invalid move: {player_move}**\n\n{message}\n\nCurrent position: `{engine.get_fen()}`\n\nPlease check the current board state in the README and try again with a legal move."
-            comment_on_issue(github_client, repository, issue_number, comment)
-            close_issue(github_client, repository, issue_number)
+            finalize_issue(issue, comment)
             return
             
         # Initialize statistics tracker
@@ -140,47 +244,52 @@ def main():
             stats.record_move("AI", ai_move, "normal")
             log_move(f"AI: {ai_move}")
             
+        # Work out the game state once, for the results and the comment
+        outcome = engine.board.outcome()
+        is_checkmate = outcome is not None and outcome.termination == chess.Termination.CHECKMATE
+        is_stalemate = outcome is not None and outcome.termination == chess.Termination.STALEMATE
+        white_to_move = engine.board.turn
+        
         # Check for game over and record results
-        if engine.board.is_game_over():
-            if engine.board.is_checkmate():
-                winner = "AI" if engine.board.turn else issue_author
+        if outcome is not None:
+            if is_checkmate:
+                winner = "AI" if white_to_move else issue_author
             else:
                 winner = "Draw"
             stats.record_game_end(winner, [issue_author])
+            flush_logs()
             
         # Save game state
         engine.save_game_state()
         
         # Generate new board
-        board_gen = BoardGenerator()
-        board_gen.generate_board_svg(engine.board)
+        board_gen = get_default_generator()
+        board_gen.write_svg(engine.board)
         
         # Update README with stats
         update_readme(engine, stats)
         
         # Create success comment
         game_status = ""
-        if engine.board.is_checkmate():
-            if engine.board.turn:  # White to move, so black won
+        if is_checkmate:
+            if white_to_move:  # White to move, so black won
                 game_status = "\n🎉 **Checkmate! AI (Black) wins!**"
             else:  # Black to move, so white won  
                 game_status = "\n🎉 **Checkmate! You (White) win!**"
-        elif engine.board.is_stalemate():
+        elif is_stalemate:
             game_status = "\n🤝 **Stalemate! It's a draw!**"
         elif engine.board.is_check():
             game_status = "\n⚠️ **Check!**"
             
         comment = f"✅ **Move accepted: {player_move}**\n\nAI responds with: **{ai_move}**\n{ai_message}{game_status}\n\nCheck the updated board in the README!"
         
-        comment_on_issue(github_client, repository, issue_number, comment)
-        close_issue(github_client, repository, issue_number)
+        finalize_issue(issue, comment)
         
         print(f"Successfully processed move: {player_move}, AI responded: {ai_move}")
         
     except Exception as e:
         error_comment = f"❌ **Error processing move**\n\nThere was an unexpected error: {str(e)}\n\nPlease try again or report this issue."
-        comment_on_issue(github_client, repository, issue_number, error_comment)
-        close_issue(github_client, repository, issue_number)
+        finalize_issue(issue, error_comment)
         print(f"Error processing move: {e}")
         sys.exit(1)
 